@@ -1,19 +1,89 @@
 from flask import Flask, render_template, Response, jsonify
 import cv2
 import os
+import sys
 import numpy as np
 from deepface import DeepFace
+from deepface.commons import distance as dst
+from deepface.commons import functions
+from deepface.extendedmodels import Gender, Emotion
 import json
+import hashlib
 from datetime import datetime
 import threading
+import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
 import tensorflow as tf
 
+try:
+    from turbojpeg import TurboJPEG
+    jpeg_encoder = TurboJPEG()
+except Exception:
+    jpeg_encoder = None  # PyTurboJPEG or libjpeg-turbo not installed
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 app = Flask(__name__)
 
 # Configuration
 UPLOAD_FOLDER = 'database/photos'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+EMBEDDINGS_CACHE = 'database/embeddings.npz'
+MODEL_NAME = 'Facenet512'
+ONNX_MODEL = 'models/facenet512.int8.onnx'
+ONNX_GPU_MODEL = 'models/facenet512.onnx'
+TRT_CACHE = 'models/trt_cache'
+DETECTION_SCALE = 0.5
+YUNET_MODEL = 'models/face_detection_yunet_2023mar.onnx'
+CAMERA_RESOLUTION = None  # e.g. (640, 480) to force a capture size; None keeps the camera's default
+CAMERA_BACKENDS = {'linux': cv2.CAP_V4L2, 'darwin': cv2.CAP_AVFOUNDATION}
+JPEG_QUALITY = 80
+PARALLEL_SEARCH_MIN_FACES = 5000
+HNSW_MIN_FACES = 1000
+ANALYSIS_INTERVAL_S = 0.5
+TRACKED_REFRESH_S = 2.0
+TRACK_IOU = 0.8
+MIN_FACE_SIZE = 30
+FACE_PADDING = 4
+# Stored with cached embeddings; change it whenever database photo preprocessing changes
+EMBEDDING_PIPELINE = 'detect-pad-letterbox'
+
+# Use every core for OpenCV's parallel loops, with its SIMD-optimized code paths enabled
+cv2.setNumThreads(os.cpu_count())
+cv2.setUseOptimized(True)
+
+# Let TensorFlow allocate GPU memory on demand instead of reserving all of it
+for gpu in tf.config.list_physical_devices('GPU'):
+    try:
+        tf.config.experimental.set_memory_growth(gpu, True)
+    except RuntimeError as e:
+        print(f"⚠️  Could not enable GPU memory growth: {e}")
 
 # Global variables
 camera = None
@@ -22,110 +92,489 @@ current_results = {
     'identity': 'Unknown',
     'gender': 'Unknown',
     'emotion': 'Unknown',
-    'confidence': 0
+    'confidence': 0,
+    'faces': []
 }
+results_lock = threading.Lock()
+results_changed = threading.Condition(results_lock)
+analysis_queue = queue.Queue(maxsize=1)
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def letterbox_faces(frame, boxes, out):
+        """Crop each box from frame, resize it bilinearly into out with centered zero padding
+        (the same layout as DeepFace's extract_faces) and scale pixels to [0, 1]"""
+        out_h, out_w = out.shape[1], out.shape[2]
+        for n in prange(boxes.shape[0]):
+            x, y, w, h = boxes[n, 0], boxes[n, 1], boxes[n, 2], boxes[n, 3]
+            factor = min(out_h / h, out_w / w)
+            new_h = max(int(h * factor), 1)
+            new_w = max(int(w * factor), 1)
+            top = (out_h - new_h) // 2
+            left = (out_w - new_w) // 2
+            scale_y = h / new_h
+            scale_x = w / new_w
+            for oy in range(out_h):
+                iy = oy - top
+                for ox in range(out_w):
+                    ix = ox - left
+                    if iy < 0 or iy >= new_h or ix < 0 or ix >= new_w:
+                        for c in range(3):
+                            out[n, oy, ox, c] = 0.0
+                        continue
+                    # Half-pixel centers, as in cv2.resize with INTER_LINEAR
+                    sy = min(max((iy + 0.5) * scale_y - 0.5, 0.0), h - 1.0)
+                    sx = min(max((ix + 0.5) * scale_x - 0.5, 0.0), w - 1.0)
+                    y0, x0 = int(sy), int(sx)
+                    y1, x1 = min(y0 + 1, h - 1), min(x0 + 1, w - 1)
+                    dy, dx = sy - y0, sx - x0
+                    for c in range(3):
+                        upper = frame[y + y0, x + x0, c] * (1 - dx) + frame[y + y0, x + x1, c] * dx
+                        lower = frame[y + y1, x + x0, c] * (1 - dx) + frame[y + y1, x + x1, c] * dx
+                        out[n, oy, ox, c] = (upper * (1 - dy) + lower * dy) / 255.0
 
 class FacialRecognitionSystem:
     def __init__(self, database_path):
         self.database_path = database_path
-        self.known_faces = []
+        # (names, shards, index), replaced in one assignment so readers never see a mix
+        self.known_faces = ((), (), None)
+        self.database_lock = threading.Lock()
+        self.search_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self.threshold = dst.findThreshold(MODEL_NAME, 'cosine')
+        self.face_detector = None
         self.face_cascade = None
+        self.use_umat = False
+        self.buffers = threading.local()
+        self.batch_buffers = {}
+        self.models = {}
+        self.onnx_session = None
+        self.embedding_backend = 'tensorflow'
+        self.last_analysis_ts = 0.0
         self.initialize_opencv()
+        self.initialize_onnx()
+        self.warm_up_models()
         self.load_database()
     
     def initialize_opencv(self):
-        """Initialize OpenCV face cascade"""
+        """Initialize the YuNet face detector, falling back to the Haar cascade"""
+        # Show which SIMD extensions, threading backend and IPP this OpenCV build uses
+        for line in cv2.getBuildInformation().splitlines():
+            line = ' '.join(line.split())
+            if line.startswith(('Baseline:', 'Dispatched code generation:', 'Parallel framework:', 'Intel IPP:')):
+                print(f"🔧 OpenCV {line}")
+        print(f"🔧 OpenCV threads: {cv2.getNumThreads()}")
+        
+        try:
+            if os.path.exists(YUNET_MODEL) and hasattr(cv2, 'FaceDetectorYN'):
+                backend, target = cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+                if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                    backend, target = cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA
+                self.face_detector = cv2.FaceDetectorYN.create(
+                    YUNET_MODEL, '', (320, 240), 0.7, 0.3, 5000, backend, target
+                )
+                print("✅ OpenCV YuNet face detector loaded")
+                return
+            print(f"⚠️  {YUNET_MODEL} not found, falling back to the Haar cascade")
+        except Exception as e:
+            print(f"⚠️  YuNet initialization error, falling back to the Haar cascade: {e}")
+        
         try:
             cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
             self.face_cascade = cv2.CascadeClassifier(cascade_path)
             if self.face_cascade.empty():
                 print("❌ Failed to load face cascade")
+                self.face_cascade = None
             else:
                 print("✅ OpenCV face cascade loaded")
+                self.select_cascade_backend()
         except Exception as e:
             print(f"❌ OpenCV initialization error: {e}")
     
-    def load_database(self):
-        """Load all images from the database folder"""
-        self.known_faces = []
+    def select_cascade_backend(self):
+        """Run the cascade through OpenCL (UMat) only if it is available and faster than the CPU"""
+        if not cv2.ocl.haveOpenCL():
+            print("⚠️  OpenCL not available, face detection runs on the CPU")
+            return
+        
+        cv2.ocl.setUseOpenCL(True)
+        probe = np.random.randint(0, 256, (240, 320), dtype=np.uint8)
+        timings = {}
+        for use_umat in (False, True):
+            image = cv2.UMat(probe) if use_umat else probe
+            # The first call compiles the OpenCL kernels, so only the second one is timed
+            self.face_cascade.detectMultiScale(image, 1.1, 4)
+            start = time.perf_counter()
+            self.face_cascade.detectMultiScale(image, 1.1, 4)
+            timings[use_umat] = time.perf_counter() - start
+        
+        self.use_umat = timings[True] < timings[False]
+        if self.use_umat:
+            print("✅ OpenCL face detection enabled")
+        else:
+            print("⚠️  OpenCL face detection is slower here, using the CPU")
+    
+    def initialize_onnx(self):
+        """Load the exported ONNX recognition model, on the GPU when ONNX Runtime has one"""
+        if ort is None:
+            print("⚠️  ONNX Runtime not installed, embeddings use TensorFlow")
+            return
+        
+        available = ort.get_available_providers()
+        providers = []
+        if 'TensorrtExecutionProvider' in available:
+            os.makedirs(TRT_CACHE, exist_ok=True)
+            providers.append(('TensorrtExecutionProvider', {
+                'trt_fp16_enable': True,
+                'trt_engine_cache_enable': True,
+                'trt_engine_cache_path': TRT_CACHE
+            }))
+        if 'CUDAExecutionProvider' in available:
+            providers.append('CUDAExecutionProvider')
+        providers.append('CPUExecutionProvider')
+        
+        # GPU providers run the float model (TensorRT casts it to FP16); the CPU runs int8
+        on_gpu = len(providers) > 1
+        if on_gpu and os.path.exists(ONNX_GPU_MODEL):
+            model_path = ONNX_GPU_MODEL
+        else:
+            # The int8 model is quantized for the CPU, so never hand it to TensorRT/CUDA
+            model_path = ONNX_MODEL
+            providers = ['CPUExecutionProvider']
+        if not os.path.exists(model_path):
+            print(f"⚠️  {model_path} not found, embeddings use TensorFlow")
+            return
+        
         try:
-            if not os.path.exists(self.database_path):
-                os.makedirs(self.database_path, exist_ok=True)
-                print(f"📁 Created database folder: {self.database_path}")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = os.cpu_count()
+            self.onnx_session = ort.InferenceSession(model_path, options, providers=providers)
+            self.onnx_input = self.onnx_session.get_inputs()[0].name
+            self.embedding_backend = model_path
+            print(f"✅ ONNX recognition model loaded ({self.onnx_session.get_providers()[0]})")
+        except Exception as e:
+            print(f"❌ ONNX model loading error: {e}")
+            self.onnx_session = None
+    
+    def detect_faces(self, frame):
+        """Return face boxes (x, y, w, h) in full-frame coordinates, clipped to the frame"""
+        frame_h, frame_w = frame.shape[:2]
+        small_size = (int(frame_w * DETECTION_SCALE), int(frame_h * DETECTION_SCALE))
+        
+        # Each stream thread reuses its own downscale buffers instead of allocating per frame
+        buffers = self.buffers
+        if getattr(buffers, 'small', None) is None or buffers.small.shape[1::-1] != small_size:
+            buffers.small = np.empty((small_size[1], small_size[0], 3), dtype=np.uint8)
+            buffers.gray = np.empty((small_size[1], small_size[0]), dtype=np.uint8)
+        
+        # Detect on a downscaled copy, then map boxes back to full size
+        if self.face_detector is not None:
+            small = cv2.resize(frame, small_size, dst=buffers.small)
+            self.face_detector.setInputSize(small_size)
+            _, detections = self.face_detector.detect(small)
+            detections = [] if detections is None else detections[:, :4]
+        elif self.face_cascade is not None:
+            if self.use_umat:
+                # Keep the whole resize + grayscale + cascade pipeline on the OpenCL device
+                small = cv2.resize(cv2.UMat(frame), small_size)
+                gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            else:
+                small = cv2.resize(frame, small_size, dst=buffers.small)
+                gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=buffers.gray)
+            # Baseline cascade settings; minSize is scaled so it agrees with MIN_FACE_SIZE at full size
+            min_size = max(int(MIN_FACE_SIZE * DETECTION_SCALE), 1)
+            detections = self.face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(min_size, min_size))
+        else:
+            return []
+        
+        faces = []
+        for detection in detections:
+            x, y, w, h = (int(v / DETECTION_SCALE) for v in detection)
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + w, frame_w), min(y + h, frame_h)
+            # Degenerate or tiny boxes are not worth a DeepFace pass
+            if x1 - x0 >= MIN_FACE_SIZE and y1 - y0 >= MIN_FACE_SIZE:
+                faces.append((x0, y0, x1 - x0, y1 - y0))
+        return faces
+    
+    def get_model(self, model_name):
+        """Return a DeepFace model, building it on first use"""
+        model = self.models.get(model_name)
+        if model is None:
+            model = self.models[model_name] = DeepFace.build_model(model_name)
+        return model
+    
+    def warm_up_models(self):
+        """Build the DeepFace models and run one dummy pass so the first frame doesn't stall"""
+        try:
+            # With ONNX Runtime embedding, the Keras Facenet512 model would only waste memory
+            model_names = ('Gender', 'Emotion') if self.onnx_session is not None else (MODEL_NAME, 'Gender', 'Emotion')
+            for model_name in model_names:
+                self.get_model(model_name)
             
-            for filename in os.listdir(self.database_path):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    filepath = os.path.join(self.database_path, filename)
-                    name = os.path.splitext(filename)[0]
-                    self.known_faces.append({
-                        'name': name,
-                        'path': filepath
-                    })
-            print(f"📸 Loaded {len(self.known_faces)} faces from database")
+            # One dummy inference through each model triggers graph tracing and kernel selection
+            dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+            self.embed(dummy)
+            self.analyze_faces(dummy, [(0, 0, 160, 160)])
+            print("✅ DeepFace models loaded and warmed up")
         except Exception as e:
-            print(f"❌ Database loading error: {e}")
+            print(f"❌ Model warm-up error: {e}")
+    
+    def pad_boxes(self, frame, boxes):
+        """Grow each box by FACE_PADDING, clamped so no slice can run past the frame"""
+        frame_h, frame_w = frame.shape[:2]
+        padded = []
+        for (x, y, w, h) in boxes:
+            x0, y0 = max(x - FACE_PADDING, 0), max(y - FACE_PADDING, 0)
+            x1, y1 = min(x + w + FACE_PADDING, frame_w), min(y + h + FACE_PADDING, frame_h)
+            padded.append((x0, y0, x1 - x0, y1 - y0))
+        return padded
+    
+    def preprocess(self, frame, boxes, target_size, reuse_buffer=True):
+        """Crop, pad, resize and scale the boxes of frame like DeepFace does, as one batch"""
+        if njit is not None:
+            # Fused Numba kernel; the reusable buffer is only safe for the analysis worker
+            buffer = self.batch_buffers.get(target_size) if reuse_buffer else None
+            if buffer is None or len(buffer) < len(boxes):
+                buffer = np.empty((len(boxes), *target_size, 3), dtype=np.float32)
+                if reuse_buffer:
+                    self.batch_buffers[target_size] = buffer
+            batch = buffer[:len(boxes)]
+            letterbox_faces(frame, np.asarray(boxes, dtype=np.int64), batch)
+            return batch
+        
+        return np.vstack([
+            functions.extract_faces(
+                img=frame[y:y+h, x:x+w],
+                target_size=target_size,
+                detector_backend='skip',
+                enforce_detection=False
+            )[0][0]
+            for (x, y, w, h) in boxes
+        ])
+    
+    def embed_faces(self, batch):
+        """Return L2-normalized embeddings for a preprocessed (N, H, W, 3) batch"""
+        if self.onnx_session is not None:
+            embeddings = self.onnx_session.run(None, {self.onnx_input: batch.astype(np.float32)})[0]
+        else:
+            embeddings = self.get_model(MODEL_NAME).predict(batch, verbose=0)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    def embed(self, img):
+        """Return the L2-normalized embedding of the largest face in img (an image or a path)"""
+        if isinstance(img, str):
+            path, img = img, cv2.imread(img)
+            if img is None:
+                raise ValueError(f"cannot read {path}")
+        
+        # Same detector, padding and letterboxing as live frames, so both sides of a match agree
+        boxes = self.detect_faces(img)
+        if boxes:
+            box = max(boxes, key=lambda face: face[2] * face[3])
+        else:
+            box = (0, 0, img.shape[1], img.shape[0])  # like enforce_detection=False: whole image
+        target_size = functions.find_target_size(model_name=MODEL_NAME)
+        batch = self.preprocess(img, self.pad_boxes(img, [box]), target_size, reuse_buffer=False)
+        return self.embed_faces(batch)[0]
+    
+    def analyze_faces(self, frame, boxes):
+        """Return the dominant gender and emotion of each face box, one batch per model"""
+        batch = self.preprocess(frame, boxes, (224, 224))
+        gender_predictions = self.get_model('Gender').predict(batch, verbose=0)
+        
+        gray = np.stack([
+            cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), (48, 48))
+            for face in batch
+        ])[..., np.newaxis]
+        emotion_predictions = self.get_model('Emotion').predict(gray, verbose=0)
+        
+        genders = [Gender.labels[i] for i in np.argmax(gender_predictions, axis=1)]
+        emotions = [Emotion.labels[i] for i in np.argmax(emotion_predictions, axis=1)]
+        return genders, emotions
     
-    def recognize_face(self, frame):
-        """Recognize face and analyze gender and emotion"""
+    def set_known_faces(self, names, embeddings):
+        """Install the database embeddings, split into row shards when the database is large"""
+        index = None
+        shards = [embeddings]
+        
+        if faiss is not None and len(names) >= HNSW_MIN_FACES:
+            # Approximate nearest neighbours in ~O(log N); inner product equals cosine here
+            faiss.omp_set_num_threads(os.cpu_count())
+            index = faiss.IndexHNSWFlat(embeddings.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.add(embeddings)
+        elif len(names) >= PARALLEL_SEARCH_MIN_FACES:
+            shards = np.array_split(embeddings, os.cpu_count())
+        
+        # Single assignment: a concurrent search sees either the old database or the new one
+        self.known_faces = (tuple(names), tuple(shards), index)
+    
+    def search(self, embeddings, known_faces):
+        """Return the index and cosine similarity of the closest face in known_faces for each embedding"""
+        _, shards, index = known_faces
+        if index is not None:
+            similarities, indices = index.search(embeddings, 1)
+            return indices[:, 0], similarities[:, 0]
+        
+        if len(shards) == 1:
+            similarities = embeddings @ shards[0].T
+        else:
+            # BLAS releases the GIL, so each shard's product runs on its own core
+            futures = [self.search_pool.submit(np.matmul, embeddings, shard.T) for shard in shards]
+            similarities = np.hstack([future.result() for future in futures])
+        best = np.argmax(similarities, axis=1)
+        return best, similarities[np.arange(len(best)), best]
+    
+    def load_embedding_cache(self):
+        """Return {filename: (mtime, sha256, embedding)} from the cache for the current model"""
+        if not os.path.exists(EMBEDDINGS_CACHE):
+            return {}
+        try:
+            cache = np.load(EMBEDDINGS_CACHE)
+            if str(cache['model']) != f"{MODEL_NAME}:{self.embedding_backend}:{EMBEDDING_PIPELINE}":
+                return {}
+            return {
+                str(filename): (float(mtime), str(sha), embedding)
+                for filename, mtime, sha, embedding in zip(
+                    cache['filenames'], cache['mtimes'], cache['shas'], cache['embeddings']
+                )
+            }
+        except Exception as cache_error:
+            print(f"⚠️  Ignoring unreadable embedding cache: {cache_error}")
+            return {}
+    
+    def load_database(self):
+        """Load all images from the database folder, embedding only new or changed photos"""
+        with self.database_lock:
+            try:
+                if not os.path.exists(self.database_path):
+                    os.makedirs(self.database_path, exist_ok=True)
+                    print(f"📁 Created database folder: {self.database_path}")
+                
+                files = sorted(
+                    filename for filename in os.listdir(self.database_path)
+                    if filename.lower().endswith(('.png', '.jpg', '.jpeg'))
+                )
+                
+                cached = self.load_embedding_cache()
+                entries = {}
+                computed = 0
+                changed = set(files) != set(cached)
+                for filename in files:
+                    filepath = os.path.join(self.database_path, filename)
+                    mtime = os.stat(filepath).st_mtime
+                    entry = cached.get(filename)
+                    
+                    # Same mtime: trust the cache. Otherwise only re-embed if the content changed.
+                    if entry and entry[0] == mtime:
+                        entries[filename] = entry
+                        continue
+                    with open(filepath, 'rb') as f:
+                        sha = hashlib.sha256(f.read()).hexdigest()
+                    changed = True
+                    if entry and entry[1] == sha:
+                        entries[filename] = (mtime, sha, entry[2])
+                        continue
+                    
+                    try:
+                        entries[filename] = (mtime, sha, self.embed(filepath))
+                        computed += 1
+                    except Exception as embed_error:
+                        print(f"⚠️  Skipping {filename}: {embed_error}")
+                
+                names = [os.path.splitext(filename)[0] for filename in entries]
+                if entries:
+                    embeddings = np.vstack([entry[2] for entry in entries.values()]).astype(np.float32)
+                else:
+                    embeddings = np.empty((0, 0), dtype=np.float32)
+                self.set_known_faces(names, embeddings)
+                
+                if changed:
+                    np.savez(
+                        EMBEDDINGS_CACHE,
+                        model=f"{MODEL_NAME}:{self.embedding_backend}:{EMBEDDING_PIPELINE}",
+                        filenames=np.array(list(entries), dtype=str),
+                        mtimes=np.array([entry[0] for entry in entries.values()], dtype=np.float64),
+                        shas=np.array([entry[1] for entry in entries.values()], dtype=str),
+                        embeddings=embeddings
+                    )
+                print(f"📸 Loaded {len(names)} faces from database ({computed} newly embedded)")
+            except Exception as e:
+                print(f"❌ Database loading error: {e}")
+    
+    def recognize_face(self, frame, boxes):
+        """Recognize every face in boxes and analyze gender and emotion"""
         global current_results
         
+        faces = []
         try:
-            # Analyze the frame for face recognition, gender, and emotion
-            analysis = DeepFace.analyze(
-                frame, 
-                actions=['gender', 'emotion'],
-                enforce_detection=False,
-                silent=True
-            )
+            # Crop with a little margin, clamped so no slice can run past the frame
+            crop_boxes = self.pad_boxes(frame, boxes)
             
-            # Handle both single face and multiple faces
-            if isinstance(analysis, list):
-                analysis = analysis[0]
+            # One forward pass per model for all faces in the frame
+            genders, emotions = self.analyze_faces(frame, crop_boxes)
             
-            # Extract gender and emotion
-            gender = analysis.get('dominant_gender', 'Unknown')
-            emotion = analysis.get('dominant_emotion', 'Unknown')
+            identities = ['Unknown'] * len(boxes)
+            confidences = [0] * len(boxes)
             
-            # Try to find matching face in database
-            identity = 'Unknown'
-            confidence = 0
-            
-            if len(self.known_faces) > 0:
+            # Read the database once so names and embeddings come from the same load
+            known_faces = self.known_faces
+            known_names = known_faces[0]
+            if len(known_names) > 0:
                 try:
-                    # Compare with database faces
-                    for known_face in self.known_faces:
-                        try:
-                            result = DeepFace.verify(
-                                frame, 
-                                known_face['path'],
-                                enforce_detection=False,
-                                silent=True
-                            )
-                            
-                            if result['verified']:
-                                identity = known_face['name']
-                                confidence = (1 - result['distance']) * 100
-                                break
-                        except Exception as verify_error:
-                            continue
+                    # Closest known face for every face in the frame
+                    target_size = functions.find_target_size(model_name=MODEL_NAME)
+                    embeddings = self.embed_faces(self.preprocess(frame, crop_boxes, target_size))
+                    best, similarities = self.search(embeddings, known_faces)
+                    
+                    for i, (idx, similarity) in enumerate(zip(best, similarities)):
+                        if idx >= 0 and 1 - similarity <= self.threshold:
+                            identities[i] = known_names[idx]
+                            confidences[i] = float(similarity) * 100
                 except Exception as recognition_error:
                     print(f"Recognition error: {recognition_error}")
             
-            current_results = {
-                'identity': identity,
-                'gender': gender,
-                'emotion': emotion,
-                'confidence': round(confidence, 2)
-            }
+            for i, box in enumerate(boxes):
+                faces.append({
+                    'box': [int(v) for v in box],
+                    'identity': identities[i],
+                    'gender': genders[i],
+                    'emotion': emotions[i],
+                    'confidence': round(confidences[i], 2)
+                })
             
         except Exception as e:
             print(f"Analysis error: {e}")
-            current_results = {
-                'identity': 'Unknown',
-                'gender': 'Unknown',
-                'emotion': 'Unknown',
-                'confidence': 0
-            }
+        
+        # The top-level fields describe the largest face, which comes first
+        primary = faces[0] if faces else {
+            'identity': 'Unknown',
+            'gender': 'Unknown',
+            'emotion': 'Unknown',
+            'confidence': 0
+        }
+        results = {
+            'identity': primary['identity'],
+            'gender': primary['gender'],
+            'emotion': primary['emotion'],
+            'confidence': primary['confidence'],
+            'faces': faces
+        }
+        
+        with results_changed:
+            current_results = results
+            results_changed.notify_all()
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0
 
 # Initialize the facial recognition system
 try:
@@ -135,22 +584,125 @@ except Exception as e:
     print(f"❌ System initialization error: {e}")
     fr_system = None
 
+class DatabaseWatcher(FileSystemEventHandler):
+    """Reload the face database shortly after photos are added, changed or removed"""
+    
+    def __init__(self, system):
+        super().__init__()
+        self.system = system
+        self.timer = None
+    
+    def on_any_event(self, event):
+        # load_database opens every photo itself, so reacting to opened/closed events would loop
+        if event.event_type not in ('created', 'modified', 'deleted', 'moved'):
+            return
+        paths = (event.src_path, getattr(event, 'dest_path', ''))
+        if event.is_directory or not any(str(path).lower().endswith(('.png', '.jpg', '.jpeg')) for path in paths):
+            return
+        # Copying a batch of photos fires many events; reload once they settle
+        if self.timer:
+            self.timer.cancel()
+        self.timer = threading.Timer(1.0, self.system.load_database)
+        self.timer.daemon = True
+        self.timer.start()
+
+if fr_system and Observer is not None:
+    database_observer = Observer()
+    database_observer.schedule(DatabaseWatcher(fr_system), UPLOAD_FOLDER)
+    database_observer.daemon = True
+    database_observer.start()
+    print(f"👀 Watching {UPLOAD_FOLDER} for new photos")
+
+class FrameGrabber(threading.Thread):
+    """Keep grabbing camera frames in the background so reads always get the newest one"""
+    
+    def __init__(self, index=0):
+        super().__init__(daemon=True)
+        self.capture = cv2.VideoCapture(index, CAMERA_BACKENDS.get(sys.platform, cv2.CAP_ANY))
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if CAMERA_RESOLUTION:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_RESOLUTION[0])
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_RESOLUTION[1])
+        self.lock = threading.Lock()
+        self.new_frame = threading.Event()
+        self.stopped = threading.Event()
+        self.frame = None
+    
+    def isOpened(self):
+        return self.capture.isOpened()
+    
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                # Blocking read happens outside the lock; the lock only covers the swap
+                success, frame = self.capture.read()
+                with self.lock:
+                    self.frame = frame if success else None
+                self.new_frame.set()
+                if not success:
+                    break
+        finally:
+            self.new_frame.set()
+            self.capture.release()
+    
+    def latest(self):
+        """Return the most recently captured frame, or None if the camera stopped"""
+        self.new_frame.wait()
+        self.new_frame.clear()
+        with self.lock:
+            return self.frame
+    
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout=1)
+        # A read still blocked in the camera releases the capture itself when it returns
+        if not self.is_alive():
+            self.capture.release()
+
+def analysis_worker():
+    """Run recognition on queued frames, one at a time"""
+    while True:
+        frame, boxes = analysis_queue.get()
+        if fr_system:
+            fr_system.recognize_face(frame, boxes)
+
+def submit_for_analysis(frame, boxes):
+    """Queue a frame and its face boxes for analysis, replacing any stale entry still waiting"""
+    try:
+        analysis_queue.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        analysis_queue.put_nowait((frame, boxes))
+    except queue.Full:
+        pass
+
+threading.Thread(target=analysis_worker, daemon=True).start()
+
 def generate_frames():
     """Generate frames from webcam with face detection"""
     global camera, recognition_active
     
     try:
-        camera = cv2.VideoCapture(0)
+        camera = FrameGrabber(0)
         
         if not camera.isOpened():
             print("❌ Cannot open camera")
             return
         
+        camera.start()
+        jpeg_params = [
+            cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+            cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+            cv2.IMWRITE_JPEG_OPTIMIZE, 0
+        ]
+        
         print("📹 Camera opened successfully")
         
         while True:
-            success, frame = camera.read()
-            if not success:
+            frame = camera.latest()
+            if frame is None:
                 print("❌ Failed to read frame")
                 break
             
@@ -158,32 +710,49 @@ def generate_frames():
             frame = cv2.flip(frame, 1)
             
             # Detect faces using OpenCV
-            if fr_system and fr_system.face_cascade:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = fr_system.face_cascade.detectMultiScale(gray, 1.1, 4)
+            if fr_system:
+                faces = fr_system.detect_faces(frame)
+                
+                with results_lock:
+                    results = current_results
+                
+                # Hand an unannotated copy to the analysis worker, largest face first. Faces that
+                # still overlap their last analyzed box are only re-analyzed every few seconds.
+                if recognition_active and len(faces) > 0:
+                    now = time.monotonic()
+                    tracked = all(
+                        any(box_iou(face, analyzed['box']) > TRACK_IOU for analyzed in results['faces'])
+                        for face in faces
+                    )
+                    interval = TRACKED_REFRESH_S if tracked else ANALYSIS_INTERVAL_S
+                    if now - fr_system.last_analysis_ts > interval:
+                        fr_system.last_analysis_ts = now
+                        faces.sort(key=lambda face: face[2] * face[3], reverse=True)
+                        submit_for_analysis(frame.copy(), faces)
                 
                 # Draw rectangles around faces
                 for (x, y, w, h) in faces:
                     cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
                     
-                    # Add recognition results text
-                    if recognition_active:
-                        cv2.putText(frame, f"Identity: {current_results['identity']}", 
+                    # Add the results of the analyzed face that overlaps this box the most
+                    matches = [(box_iou((x, y, w, h), face['box']), face) for face in results['faces']]
+                    iou, face = max(matches, key=lambda match: match[0], default=(0, None))
+                    if recognition_active and iou > 0:
+                        cv2.putText(frame, f"Identity: {face['identity']}", 
                                    (x, y-60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                        cv2.putText(frame, f"Gender: {current_results['gender']}", 
+                        cv2.putText(frame, f"Gender: {face['gender']}", 
                                    (x, y-40), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                        cv2.putText(frame, f"Emotion: {current_results['emotion']}", 
+                        cv2.putText(frame, f"Emotion: {face['emotion']}", 
                                    (x, y-20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                        if current_results['confidence'] > 0:
-                            cv2.putText(frame, f"Confidence: {current_results['confidence']}%", 
+                        if face['confidence'] > 0:
+                            cv2.putText(frame, f"Confidence: {face['confidence']}%", 
                                        (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                
-                # Perform recognition analysis in a separate thread to avoid blocking
-                if recognition_active and len(faces) > 0 and fr_system:
-                    threading.Thread(target=fr_system.recognize_face, args=(frame,), daemon=True).start()
             
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+            if jpeg_encoder:
+                frame = jpeg_encoder.encode(frame, quality=JPEG_QUALITY)
+            else:
+                ret, buffer = cv2.imencode('.jpg', frame, jpeg_params)
+                frame = buffer.tobytes()
             
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
@@ -192,7 +761,7 @@ def generate_frames():
         print(f"❌ Frame generation error: {e}")
     finally:
         if camera:
-            camera.release()
+            camera.stop()
 
 @app.route('/')
 def index():
@@ -207,8 +776,6 @@ def start_recognition():
     global recognition_active
     try:
         recognition_active = True
-        if fr_system:
-            fr_system.load_database()  # Reload database
         return jsonify({'status': 'Recognition started'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -222,16 +789,42 @@ def stop_recognition():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def to_json(obj):
+    """Serialize obj to UTF-8 JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode()
+
 @app.route('/get_results')
 def get_results():
-    return jsonify(current_results)
+    with results_lock:
+        results = current_results
+    return Response(to_json(results), mimetype='application/json')
+
+def stream_results():
+    """Yield current_results as a server-sent event each time it changes"""
+    last_sent = None
+    while True:
+        with results_changed:
+            results_changed.wait_for(lambda: current_results is not last_sent, timeout=15)
+            results = current_results
+        if results is last_sent:
+            # Comment line keeps idle connections from being closed by proxies
+            yield b': keep-alive\n\n'
+            continue
+        last_sent = results
+        yield b"data: " + to_json(results) + b"\n\n"
+
+@app.route('/results_stream')
+def results_stream():
+    return Response(stream_results(), mimetype='text/event-stream')
 
 @app.route('/reload_database')
 def reload_database():
     try:
         if fr_system:
             fr_system.load_database()
-            return jsonify({'status': f'Database reloaded. {len(fr_system.known_faces)} faces loaded.'})
+            return jsonify({'status': f'Database reloaded. {len(fr_system.known_faces[0])} faces loaded.'})
         else:
             return jsonify({'error': 'System not initialized'}), 500
     except Exception as e:
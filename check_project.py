@@ -4,35 +4,88 @@ Project structure and dependency checker
 """
 import os
 import sys
-import importlib
+import functools
+import threading
+from collections.abc import Mapping
+from importlib.metadata import PackageNotFoundError, distribution, distributions
+from types import MappingProxyType
+
+REQUIRED_STRUCTURE = MappingProxyType({
+    'files': (
+        'app.py',
+        'requirements.txt',
+        'templates/index.html',
+        'static/css/style.css',
+        'static/js/script.js'
+    ),
+    'folders': (
+        'templates',
+        'static',
+        'static/css',
+        'static/js',
+        'database',
+        'database/photos'
+    )
+})
+
+# (distribution names, any one will do; display name), so versions come from metadata without importing
+DEPENDENCIES = (
+    (('flask',), 'Flask'),
+    (('opencv-python', 'opencv-contrib-python', 'opencv-python-headless'), 'OpenCV'),
+    (('numpy',), 'NumPy'),
+    (('pillow',), 'Pillow'),
+    (('tensorflow', 'tensorflow-macos', 'tensorflow-cpu'), 'TensorFlow'),
+    (('deepface',), 'DeepFace'),
+)
+
+# Written by create_missing_structure when requirements.txt is missing; keep in sync with it
+DEFAULT_REQUIREMENTS = (
+    'numpy==1.24.3',
+    'opencv-python==4.8.1.78',
+    'tensorflow==2.13.0',
+    'keras==2.13.1',
+    'deepface==0.0.79',
+    'Flask==2.3.3',
+    'Pillow==10.0.1',
+    'pandas==1.5.3',
+    'gdown==4.7.1',
+    'tqdm==4.65.0',
+    'protobuf==3.20.3',
+    'werkzeug==2.3.7',
+    'jinja2==3.1.2',
+)
+
+# The camera probe asks for small frames and gives up on a device that hangs
+CAMERA_PROBE_SIZE = (320, 240)
+CAMERA_TIMEOUT_S = 3
+
+# Python versions TensorFlow 2.13 (requirements.txt) publishes wheels for
+SUPPORTED_PYTHON = ((3, 8), (3, 11))
+
+def check_python_version():
+    """Check the interpreter is in the range TensorFlow supports"""
+    print("\n🐍 Checking Python version...")
+    version = sys.version_info[:3]
+    low, high = SUPPORTED_PYTHON
+    supported = f"{low[0]}.{low[1]}-{high[0]}.{high[1]}"
+    python = f"Python {version[0]}.{version[1]}.{version[2]}"
+    
+    # One tuple comparison per bound; TensorFlow publishes no wheels outside this range
+    if not low <= version[:2] <= high:
+        print(f"  ❌ {python}: TensorFlow needs Python {supported}")
+        return [f"{python} (needs {supported})"]
+    print(f"  ✅ {python}")
+    return []
 
 def check_project_structure():
     """Check if all required files and folders exist"""
     print("🔍 Checking project structure...\n")
     
-    required_structure = {
-        'files': [
-            'app.py',
-            'requirements.txt',
-            'templates/index.html',
-            'static/css/style.css',
-            'static/js/script.js'
-        ],
-        'folders': [
-            'templates',
-            'static',
-            'static/css',
-            'static/js',
-            'database',
-            'database/photos'
-        ]
-    }
-    
     missing_items = []
     
     # Check folders
     print("📁 Checking folders:")
-    for folder in required_structure['folders']:
+    for folder in REQUIRED_STRUCTURE['folders']:
         if os.path.exists(folder):
             print(f"  ✅ {folder}")
         else:
@@ -41,7 +94,7 @@ def check_project_structure():
     
     # Check files
     print("\n📄 Checking files:")
-    for file in required_structure['files']:
+    for file in REQUIRED_STRUCTURE['files']:
         if os.path.exists(file):
             print(f"  ✅ {file}")
         else:
@@ -65,40 +118,85 @@ def check_project_structure():
     
     return missing_items
 
+class InstalledPackages(Mapping):
+    """Read-only {lowercase distribution name: version} view that only reads metadata for names looked up"""
+    
+    def __init__(self):
+        self.versions = {}
+    
+    def __getitem__(self, name):
+        name = name.lower()
+        if name not in self.versions:
+            try:
+                self.versions[name] = distribution(name).version
+            except PackageNotFoundError:
+                self.versions[name] = None
+        if self.versions[name] is None:
+            raise KeyError(name)
+        return self.versions[name]
+    
+    def __iter__(self):
+        names = (dist.metadata["Name"] for dist in distributions())
+        return (name.lower() for name in names if name)
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+
+@functools.lru_cache(maxsize=1)
+def get_installed_packages():
+    """Return the installed-package view shared by all checks
+    
+    Lookups are cached per process; call get_installed_packages.cache_clear()
+    after installing or removing packages.
+    """
+    return InstalledPackages()
+
+@functools.lru_cache(maxsize=1)
+def load_requirements(path='requirements.txt'):
+    """Return {lowercase name: SpecifierSet} parsed once from requirements.txt"""
+    try:
+        from packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        return {}  # Without packaging, only presence is checked
+    
+    requirements = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if not line or line.startswith('-'):
+                    continue  # pip options such as -r, -e and --extra-index-url
+                try:
+                    requirement = Requirement(line)
+                except InvalidRequirement:
+                    continue  # e.g. plain paths or URLs; only presence is checked for those
+                requirements[requirement.name.lower()] = requirement.specifier
+    return requirements
+
+@functools.lru_cache(maxsize=None)
+def version_satisfies(dist, version):
+    """Return whether version meets the requirements.txt specifier for dist (True if unpinned)"""
+    specifier = load_requirements().get(dist)
+    return specifier is None or specifier.contains(version, prereleases=True)
+
 def check_dependencies():
     """Check if all required Python packages are installed"""
     print("\n🐍 Checking Python dependencies...\n")
     
-    dependencies = [
-        ('flask', 'Flask'),
-        ('cv2', 'OpenCV'),
-        ('numpy', 'NumPy'),
-        ('PIL', 'Pillow'),
-        ('tensorflow', 'TensorFlow'),
-    ]
-    
+    installed = get_installed_packages()
     missing_deps = []
     
-    for module, name in dependencies:
-        try:
-            mod = importlib.import_module(module)
-            version = getattr(mod, '__version__', 'unknown')
+    for dist_names, name in DEPENDENCIES:
+        dist = next((dist for dist in dist_names if dist in installed), dist_names[0])
+        version = installed.get(dist)
+        if version and not version_satisfies(dist, version):
+            print(f"  ⚠️  {name}: {version} (requirements.txt wants {load_requirements()[dist]})")
+        elif version:
             print(f"  ✅ {name}: {version}")
-        except ImportError:
+        else:
             print(f"  ❌ {name}: NOT INSTALLED")
             missing_deps.append(name)
     
-    # Special check for DeepFace (can be slow to import)
-    print("\n🤖 Checking DeepFace...")
-    try:
-        from deepface import DeepFace
-        print("  ✅ DeepFace: Available")
-    except ImportError:
-        print("  ❌ DeepFace: NOT INSTALLED")
-        missing_deps.append('DeepFace')
-    except Exception as e:
-        print(f"  ⚠️  DeepFace: Warning - {e}")
-    
     return missing_deps
 
 def check_camera_access():
@@ -106,19 +204,44 @@ def check_camera_access():
     print("\n📹 Checking camera access...")
     try:
         import cv2
-        cap = cv2.VideoCapture(0)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                print("  ✅ Camera access successful")
-                print(f"  📐 Frame size: {frame.shape}")
-            else:
-                print("  ❌ Camera opened but cannot read frames")
-            cap.release()
-        else:
-            print("  ❌ Cannot open camera")
     except Exception as e:
         print(f"  ❌ Camera check error: {e}")
+        return
+    
+    result = {}
+    
+    def probe():
+        # Small MJPG frames let the driver skip its resolution ramp and colour conversion
+        backend = {'linux': cv2.CAP_V4L2, 'darwin': cv2.CAP_AVFOUNDATION}.get(sys.platform, cv2.CAP_ANY)
+        cap = cv2.VideoCapture(0, backend)
+        try:
+            result['opened'] = cap.isOpened()
+            if result['opened']:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_PROBE_SIZE[0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_PROBE_SIZE[1])
+                result['read'], result['frame'] = cap.read()
+        except Exception as e:
+            result['error'] = e
+        finally:
+            cap.release()
+    
+    # A hung capture device must not stall the checker, so probe in a daemon thread
+    thread = threading.Thread(target=probe, daemon=True)
+    thread.start()
+    thread.join(CAMERA_TIMEOUT_S)
+    
+    if thread.is_alive():
+        print(f"  ❌ Camera did not respond within {CAMERA_TIMEOUT_S}s")
+    elif 'error' in result:
+        print(f"  ❌ Camera check error: {result['error']}")
+    elif not result.get('opened'):
+        print("  ❌ Cannot open camera")
+    elif result.get('read'):
+        print("  ✅ Camera access successful")
+        print(f"  📐 Frame size: {result['frame'].shape}")
+    else:
+        print("  ❌ Camera opened but cannot read frames")
 
 def create_missing_structure():
     """Create missing folders and basic files"""
@@ -133,15 +256,7 @@ def create_missing_structure():
     # Create basic requirements.txt if missing
     if not os.path.exists('requirements.txt'):
         with open('requirements.txt', 'w') as f:
-            f.write("""Flask==2.3.3
-opencv-python==4.8.1.78
-deepface==0.0.75
-numpy==1.24.3
-Pillow==10.0.1
-tensorflow==2.13.0
-keras==2.13.1
-protobuf==3.20.3
-""")
+            f.write("\n".join(DEFAULT_REQUIREMENTS) + "\n")
         print("  📄 Created: requirements.txt")
     
     print("  ✅ Basic structure created!")
@@ -153,7 +268,8 @@ def main():
     # Check project structure
     missing_structure = check_project_structure()
     
-    # Check dependencies
+    # Check interpreter and dependencies
+    python_issues = check_python_version()
     missing_deps = check_dependencies()
     
     # Check camera
@@ -173,18 +289,25 @@ def main():
         if create_missing == 'y':
             create_missing_structure()
     
+    if python_issues:
+        print("\n❌ Unsupported Python:")
+        for issue in python_issues:
+            print(f"  • {issue}")
+        print("\n💡 Create a virtual environment with a supported Python, then install there")
+    
     if missing_deps:
         print("\n❌ Missing dependencies:")
         for dep in missing_deps:
             print(f"  • {dep}")
         print(f"\n💡 Install with: pip install -r requirements.txt")
     
-    if not missing_structure and not missing_deps:
+    issues = missing_structure + python_issues + missing_deps
+    if not issues:
         print("\n🎉 PROJECT READY TO RUN!")
         print("\n🚀 Start with: python app.py")
         print("🌐 Then open: http://localhost:5000")
     else:
-        print(f"\n⚠️  Fix {len(missing_structure + missing_deps)} issues before running")
+        print(f"\n⚠️  Fix {len(issues)} issues before running")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
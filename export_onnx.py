@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Export the Facenet512 recognition model to ONNX and quantize it to int8
+Requires: pip install tf2onnx onnxruntime
+"""
+import os
+import sys
+
+ONNX_PATH = "models/facenet512.onnx"
+INT8_PATH = "models/facenet512.int8.onnx"
+
+def main():
+    print("🔄 Exporting Facenet512 to ONNX")
+    print("=" * 50)
+    
+    try:
+        import tensorflow as tf
+        import tf2onnx
+        from deepface import DeepFace
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError as e:
+        print(f"❌ Missing dependency: {e}")
+        print("💡 Install with: pip install tf2onnx onnxruntime")
+        return False
+    
+    try:
+        os.makedirs(os.path.dirname(ONNX_PATH), exist_ok=True)
+        
+        model = DeepFace.build_model("Facenet512")
+        input_signature = (tf.TensorSpec((None, 160, 160, 3), tf.float32, name="input"),)
+        tf2onnx.convert.from_keras(model, input_signature=input_signature, output_path=ONNX_PATH)
+        print(f"✅ Exported: {ONNX_PATH}")
+        
+        quantize_dynamic(ONNX_PATH, INT8_PATH, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized: {INT8_PATH}")
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
+        return False
+    
+    print("\n🎉 Export completed! Restart app.py to use the ONNX model.")
+    print("💡 Database embeddings are recomputed with the new model on the next start")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
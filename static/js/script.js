@@ -1,7 +1,7 @@
 class FacialRecognitionApp {
     constructor() {
         this.isRecognitionActive = false;
-        this.updateInterval = null;
+        this.resultsSource = null;
         this.initializeElements();
         this.bindEvents();
         this.startResultsUpdater();
@@ -105,21 +105,6 @@ class FacialRecognitionApp {
         }
     }
 
-    async updateResults() {
-        if (!this.isRecognitionActive) return;
-        
-        try {
-            const response = await fetch('/get_results');
-            const data = await response.json();
-            
-            if (response.ok) {
-                this.displayResults(data);
-            }
-        } catch (error) {
-            console.error('Error fetching results:', error);
-        }
-    }
-
     displayResults(results) {
         // Update identity with color coding
         this.identityElement.textContent = results.identity;
@@ -254,10 +239,15 @@ class FacialRecognitionApp {
     }
 
     startResultsUpdater() {
-        // Update results every 500ms when recognition is active
-        this.updateInterval = setInterval(() => {
-            this.updateResults();
-        }, 500);
+        // The server pushes results whenever an analysis finishes
+        this.resultsSource = new EventSource('/results_stream');
+        this.resultsSource.addEventListener('message', (event) => {
+            if (!this.isRecognitionActive) return;
+            this.displayResults(JSON.parse(event.data));
+        });
+        this.resultsSource.addEventListener('error', () => {
+            console.error('Results stream error');
+        });
     }
 }
 